@@ -148,7 +148,7 @@ if __name__ == "__main__":
                 J2_main[ii, jj * nDim: (jj + 1) * nDim] = np.zeros(nDim)
 
 
-    Dm = utils.duplication_matrix_char(N)
+    Dm = utils.duplication_matrix(N)
     M = -0.5 * pinv(Dm) @ np.kron(C.T, C) @ Dm
 
     Sigma_b0 = np.zeros((n_bar, n_bar, len(K_array), len(STD_ARRAY)))
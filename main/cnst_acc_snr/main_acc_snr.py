@@ -62,7 +62,7 @@ if __name__ == "__main__":
     # Let the acceleration values be in the unknown frame of the mobile node
     H2 = np.array([[np.cos(THETA), -np.sin(THETA)], [np.sin(THETA), np.cos(THETA)]])
 
-    Dm = utils.duplication_matrix_char(N)
+    Dm = utils.duplication_matrix(N)
     M = -0.5 * pinv(Dm) @ np.kron(C.T, C) @ Dm
 
     Y0_bar_hat = np.zeros((nDim, N, N_EXP, len(SNR_gains)))
@@ -177,11 +177,11 @@ if __name__ == "__main__":
             err_b4_hat[:, nn, kk] = np.squeeze(b4 - b4_hat)
 
             # relative position - centered
-            Y0_bar_hat[:, :, nn, kk] = utils.cMDS(B0_hat, center=False)[:nDim, :]
+            Y0_bar_hat[:, :, nn, kk] = utils.cMDS(B0_hat, center=False, nDim=nDim)
             err_y0_hat[:, nn, kk], H_Y0 = procrustes_error(Y0_bar_hat[:, :, nn, kk], Y0_bar)
 
             # relative acceleration - centered
-            Y2_tilde_hat[:, :, nn, kk] = utils.cMDS(4 * B4_hat, center=False)[:nDim, :]
+            Y2_tilde_hat[:, :, nn, kk] = utils.cMDS(4 * B4_hat, center=False, nDim=nDim)
             err_y2_hat[:, nn, kk], H_Y2 = procrustes_error(Y2_tilde_hat[:, :, nn, kk], Y2_bar)
 
             Y1_bar_hat[:, :, nn, kk], H2_hat[:, :, nn, kk] = utils.solve_lyapunov_like_eqns(Y0_bar_hat[:, :, nn, kk], B1_hat, Y2_tilde_hat[:, :, nn, kk], 2 * B3_hat, M=nDim, N=N)
@@ -240,7 +240,7 @@ if __name__ == "__main__":
             err_b3_acc[:, nn, kk] = np.squeeze(b3 - b3_acc)
 
             # relative position - centered
-            Y0_bar_acc[:, :, nn, kk] = utils.cMDS(B0_acc, center=False)[:nDim, :]
+            Y0_bar_acc[:, :, nn, kk] = utils.cMDS(B0_acc, center=False, nDim=nDim)
             err_y0_acc[:, nn, kk], H_Y0 = procrustes_error(Y0_bar_acc[:, :, nn, kk], Y0_bar)
 
             # relative velocity error
@@ -1,12 +1,23 @@
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 import math
 import utils
 # import cvxpy as cp
-from numpy.linalg import pinv, lstsq, svd, norm
-from scipy.linalg import orthogonal_procrustes
+from numpy.linalg import pinv, norm
+from scipy.linalg import polar
 import matplotlib as mpl
-mpl.use('Qt5Agg')
+# Agg when running headless (HEADLESS=1/true/yes/on), on Linux without a display server, or when Qt is missing
+HEADLESS = os.environ.get('HEADLESS', '').strip().lower() in ('1', 'true', 'yes', 'on')
+NO_DISPLAY = sys.platform.startswith('linux') and not (os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+if HEADLESS or NO_DISPLAY:
+    mpl.use('Agg')
+else:
+    try:
+        mpl.use('Qt5Agg')
+    except ImportError:
+        mpl.use('Agg')
 
 np.set_printoptions(formatter={'float': lambda x: "{0:0.6f}".format(x)})
 
@@ -18,21 +29,21 @@ def orientation_estimate(X1, X0, b):
     I_n2 = np.identity(n * n)
     J = utils.commutation_matrix(n, n)
     Phi = (I_n2 + J) @ np.kron(X1.T, X0.T)
-    vecH_ls = pinv(Phi.T @ Phi) @ Phi.T @ b
-    # vecH_ls = lstsq(Phi, b)
+    vecH_ls = utils.lstsq_cached(Phi, b)
 
-    # svd and approximation
+    # closest orthogonal matrix (polar factor U @ VT of the svd)
     # H_est = utils.vectorize_inverse(vecH)
     H_est_ls = utils.vectorize_inverse(vecH_ls)
-    U, S, VT = svd(H_est_ls)
-    H = U @ VT
+    H, _ = polar(H_est_ls)
 
     return H, H_est_ls
 
 def procrustes_error(Z, Z_bar):
-    H, scale = orthogonal_procrustes(Z.T, Z_bar.T)
-    Z_proc = Z.T @ H
-    err_z = utils.vectorize(Z_bar - Z_proc.T)
+    # orthogonal_procrustes(Z.T, Z_bar.T) with the svd workspace reused across calls
+    U, _, VT = utils.svd_cached(Z @ Z_bar.T)
+    H = U @ VT
+    Z_proc = H.T @ Z
+    err_z = utils.vectorize(Z_bar - Z_proc)
 
     return np.squeeze(err_z), H
 
@@ -72,19 +83,32 @@ if __name__ == "__main__":
     B2 = Y1_bar.T @ Y1_bar
     b2 = utils.half_vectorize(B2)
 
+    # squared pairwise distances of X(t) = Y0 + Y1 t are quadratic in t: E0 + t E1 + t^2 E2
+    E0 = utils.edm(Y0)
+    E2 = utils.edm(Y1)
+    B01 = Y0.T @ Y1 + Y1.T @ Y0
+    E1 = np.diag(B01)[:, None] + np.diag(B01)[None, :] - 2. * B01
+    n_EDM = int(N * (N - 1) / 2.)
+    iu_skew = np.triu_indices(N, 1)
+
     if OPTIONS[0]:
-        Sigma_d = STD_DIST ** 2 * np.identity(n_bar)
-        Dm = utils.duplication_matrix_char(N)
-        M = -0.5 * pinv(Dm) @ np.kron(C.T, C) @ Dm
-
-        Y0_main_bar = np.zeros((nDim, N, N_EXP, len(K_array)))
-        Y1_main_tilde = np.zeros((nDim, N, N_EXP, len(K_array)))
-        H1_main = np.zeros((nDim, nDim, N_EXP, len(K_array)))
-        err_main_b0 = np.zeros((n_bar, N_EXP, len(K_array)))
-        err_main_b1 = np.zeros((n_bar, N_EXP, len(K_array)))
-        err_main_b2 = np.zeros((n_bar, N_EXP, len(K_array)))
-        err_main_y0 = np.zeros((nDim * N, N_EXP, len(K_array)))
-        err_main_y1 = np.zeros((nDim * N, N_EXP, len(K_array)))
+        iu = np.triu_indices(N)
+        # M = -0.5 * pinv(Dm) @ kron(C.T, C) @ Dm maps vech(X) to vech(-0.5 * C @ X @ C), so its entry
+        # ((a, b), (i, j)) is -0.5 * s_ij * (C[a, i] C[b, j] + C[a, j] C[b, i]) with s_ij = 1/2 when i == j
+        ia, ib = iu
+        s_ij = np.where(ia == ib, 0.5, 1.)
+        M = -0.5 * s_ij * (C[np.ix_(ia, ia)] * C[np.ix_(ib, ib)] + C[np.ix_(ia, ib)] * C[np.ix_(ib, ia)])
+        # Sigma_calD = 4 * STD_DIST^2 * diag(d^2), hence diag(M @ Sigma_calD @ M.T) = 4 * STD_DIST^2 * M^2 @ d^2
+        M2 = np.square(M)
+
+        Y0_main_bar = np.zeros((len(K_array), N_EXP, nDim, N))
+        Y1_main_tilde = np.zeros((len(K_array), N_EXP, nDim, N))
+        H1_main = np.zeros((len(K_array), N_EXP, nDim, nDim))
+        err_main_b0 = np.zeros((len(K_array), N_EXP, n_bar))
+        err_main_b1 = np.zeros((len(K_array), N_EXP, n_bar))
+        err_main_b2 = np.zeros((len(K_array), N_EXP, n_bar))
+        err_main_y0 = np.zeros((len(K_array), N_EXP, nDim * N))
+        err_main_y1 = np.zeros((len(K_array), N_EXP, nDim * N))
         rmse_main_b0 = np.zeros(len(K_array))
         rmse_main_b1 = np.zeros(len(K_array))
         rmse_main_b2 = np.zeros(len(K_array))
@@ -93,14 +117,14 @@ if __name__ == "__main__":
 
 
     if OPTIONS[1]:
-        Y0_gtwr_bar = np.zeros((nDim, N, N_EXP, len(K_array)))
-        Y1_gtwr_tilde = np.zeros((nDim, N, N_EXP, len(K_array)))
-        H1_gtwr = np.zeros((nDim, nDim, N_EXP, len(K_array)))
-        err_gtwr_b0 = np.zeros((n_bar, N_EXP, len(K_array)))
-        err_gtwr_b1 = np.zeros((n_bar, N_EXP, len(K_array)))
-        err_gtwr_b2 = np.zeros((n_bar, N_EXP, len(K_array)))
-        err_gtwr_y0 = np.zeros((nDim * N, N_EXP, len(K_array)))
-        err_gtwr_y1 = np.zeros((nDim * N, N_EXP, len(K_array)))
+        Y0_gtwr_bar = np.zeros((len(K_array), N_EXP, nDim, N))
+        Y1_gtwr_tilde = np.zeros((len(K_array), N_EXP, nDim, N))
+        H1_gtwr = np.zeros((len(K_array), N_EXP, nDim, nDim))
+        err_gtwr_b0 = np.zeros((len(K_array), N_EXP, n_bar))
+        err_gtwr_b1 = np.zeros((len(K_array), N_EXP, n_bar))
+        err_gtwr_b2 = np.zeros((len(K_array), N_EXP, n_bar))
+        err_gtwr_y0 = np.zeros((len(K_array), N_EXP, nDim * N))
+        err_gtwr_y1 = np.zeros((len(K_array), N_EXP, nDim * N))
         rmse_gtwr_b0 = np.zeros(len(K_array))
         rmse_gtwr_b1 = np.zeros(len(K_array))
         rmse_gtwr_b2 = np.zeros(len(K_array))
@@ -113,13 +137,28 @@ if __name__ == "__main__":
         t_pwd = np.linspace(-tend, tend, K + 1).reshape(K + 1, 1)
 
         # Simulation
-        X = np.zeros((nDim, N, K + 1))
-        pwd = np.zeros((N, N, K + 1))
-        pwd_noise = np.zeros((N, N, K + 1))
+        t_b = t_pwd.reshape((K + 1, 1, 1))
+        # snapshots are stored along the leading axis: pwd[ii] is the distance matrix at t_pwd[ii]
+        pwd = np.sqrt(np.maximum(E0 + t_b * E1 + np.square(t_b) * E2, 0.))
+
+        if OPTIONS[0]:
+            # Forming the per-timestamp regressors [1, t, t^2] (depends only on K)
+            P = np.vander(t_pwd.ravel(), 3, increasing=True)
+            PP = np.einsum('ip,iq->ipq', P, P)
+
+        if OPTIONS[1]:
+            # Forming matrix V (depends only on K)
+            L = 4
+            I_nel = np.identity(N_bar)
+            V = utils.time_design_matrix(t_pwd, N_bar, L)
 
-        for ii in range(K + 1):
-            X[:, :, ii] = Y0 + Y1 * t_pwd[ii]
-            pwd[:, :, ii] = utils.pairwise_distance(X[:, :, ii])
+            # getting the true range derivatives by dividing by appropriate coefficients as given by taylor expansion
+            gamma = np.zeros(L + 1)
+            for ii in range(L + 1):
+                gamma[ii] = math.factorial(ii)
+
+            # least squares operator, accounting for the factorials
+            V_ls = np.kron(np.diag(gamma), I_nel) @ pinv(V.T @ V) @ V.T
 
         for nn in range(N_EXP):
             # Adding measurement noise
@@ -127,109 +166,78 @@ if __name__ == "__main__":
             # noise = [] # To be used for monte carlo runs
             # assigning noise by using specific seeding
             np.random.seed(SEED_START + 10 * nn)
-            n_EDM = int(N * (N - 1) / 2.)
             if noise_flag:
                 noise_val = np.random.normal(0.0, STD_DIST, n_EDM * (K + 1))
             else:
                 noise_val = np.zeros((n_EDM * (K + 1), 1))
 
-            D = np.zeros((N, N, K + 1))
-            for ii in range(K + 1):
-                vec_eta = noise_val[ii * n_EDM: (ii + 1) * n_EDM]
-                eta = utils.half_vectorize_inverse(vec_eta, skew=True)
-                # take square root of edm and then add noise, and then square afterwards
-                pwd_noise[:, :, ii] = pwd[:, :, ii] + eta
-                D[:, :, ii] = np.square(pwd_noise[:, :, ii])
+            # symmetric, zero-diagonal noise matrix for every snapshot
+            eta = np.zeros((K + 1, N, N))
+            eta[:, iu_skew[0], iu_skew[1]] = noise_val.reshape((K + 1, n_EDM))
+            eta += np.transpose(eta, (0, 2, 1))
+            # take square root of edm and then add noise, and then square afterwards
+            pwd_noise = pwd + eta
+            D = np.square(pwd_noise)
 
             if OPTIONS[0]:
                 # Coefficient estimates
-                # Forming matrix T
-                n_bar = int(N * (N + 1) / 2.)
-                I_nbar = np.identity(n_bar)
-                T0 = np.kron(np.ones(t_pwd.shape), I_nbar)
-                T1 = np.kron(t_pwd, I_nbar)
-                T2 = np.kron(np.square(t_pwd), I_nbar)
-                T = np.hstack((T0, T1, T2))
-
                 # double-centering all EDMs to get their respective Gramians
-                G = np.zeros((N, N, K + 1))
-                vecG = np.zeros((n_bar * (K + 1), 1))
-                for ii in range(K + 1):
-                    G[:, :, ii] = utils.double_center(D[:, :, ii])
-                    vecG[ii * n_bar: (ii + 1) * n_bar] = utils.half_vectorize(G[:, :, ii])
+                G = -0.5 * (C @ D @ C)
+                vecG = G[:, iu[0], iu[1]].reshape((n_bar * (K + 1), 1))
 
 
                 # Weighted least squares
-                Sigma_g = np.zeros((n_bar * (K + 1), n_bar * (K + 1)))
-                w = np.zeros((K + 1) * n_bar)
-
-                for ii in range(K + 1):
-                    d = utils.half_vectorize(pwd_noise[:, :, ii]).reshape(n_bar)
-                    Sigma_calD = 4. * np.diag(d) @ Sigma_d @ np.diag(d)
-                    Sigma_g[ii * n_bar: (ii + 1) * n_bar, ii * n_bar: (ii + 1) * n_bar] = M @ Sigma_calD @ M.T
-
-                for jj in range(len(w)):
-                    w[jj] = 1 / Sigma_g[jj, jj]
+                # only the diagonal of the block-diagonal Sigma_g is needed for the weights
+                d = pwd_noise[:, iu[0], iu[1]]
+                w = 1. / (4. * STD_DIST ** 2 * (M2 @ np.square(d).T).T.ravel())
                 # theta_hat_ls = pinv(T.T @ np.diag(w) @ T) @ T.T @ np.diag(w) @ vecG
-                Tw = np.diag(w) @ T
-                vecGw = np.diag(w) @ vecG
-                sol = lstsq(Tw, vecGw, rcond=None)
-                theta_hat_ls = sol[0]
+                # T = [I, t I, t^2 I] decouples the row-scaled system diag(w) T theta = diag(w) vecG
+                # into n_bar independent 3 x 3 normal equations, one per element of vech(G)
+                Wsq = np.square(w).reshape((K + 1, n_bar))
+                Gk = vecG.reshape((K + 1, n_bar))
+                A_j = np.einsum('ij,ipq->jpq', Wsq, PP)
+                r_j = np.einsum('ij,ip,ij->jp', Wsq, P, Gk)
+                theta_j = np.linalg.solve(A_j, r_j[:, :, None])[:, :, 0]
+                theta_hat_ls = theta_j.T.reshape((3 * n_bar, 1))
 
                 b0_main = theta_hat_ls[:n_bar]
-                err_main_b0[:, nn, kk] = np.squeeze(b0 - b0_main)
+                err_main_b0[kk, nn] = np.squeeze(b0 - b0_main)
                 B0_main = utils.half_vectorize_inverse(b0_main)
 
                 b1_main = theta_hat_ls[n_bar:2*n_bar]
-                err_main_b1[:, nn, kk] = np.squeeze(b1 - b1_main)
+                err_main_b1[kk, nn] = np.squeeze(b1 - b1_main)
                 B1_main = utils.half_vectorize_inverse(b1_main)
 
                 b2_main = theta_hat_ls[2*n_bar:]
-                err_main_b2[:, nn, kk] = np.squeeze(b2 - b2_main)
+                err_main_b2[kk, nn] = np.squeeze(b2 - b2_main)
                 B2_main = utils.half_vectorize_inverse(b2_main)
 
+                # cMDS of B0 and B2 with a single batched eigendecomposition (top nDim eigenpairs)
+                eig_val, eig_vec = np.linalg.eigh(np.stack((B0_main, B2_main)))
+                eig_val = eig_val[:, :-nDim - 1:-1]
+                eig_vec = eig_vec[:, :, :-nDim - 1:-1]
+                Y_main = np.sqrt(np.maximum(eig_val, 0.))[:, :, None] * np.transpose(eig_vec, (0, 2, 1))
+
                 # relative position - centered
-                Y0_main_bar[:, :, nn, kk] = utils.cMDS(B0_main, center=False)[:nDim, :]
-                err_main_y0[:, nn, kk], H_Y0 = procrustes_error(Y0_main_bar[:, :, nn, kk], Y0_bar)
+                Y0_main_bar[kk, nn] = Y_main[0]
+                err_main_y0[kk, nn], H_Y0 = procrustes_error(Y0_main_bar[kk, nn], Y0_bar)
 
                 # relative velocity - centered with unknown rotation
-                Y1_main_tilde[:, :, nn, kk] = utils.cMDS(B2_main, center=False)[:nDim, :]
-                err_main_y1[:, nn, kk], H_Y1 = procrustes_error(Y1_main_tilde[:, :, nn, kk], Y1_bar)
+                Y1_main_tilde[kk, nn] = Y_main[1]
+                err_main_y1[kk, nn], H_Y1 = procrustes_error(Y1_main_tilde[kk, nn], Y1_bar)
 
                 # Relative orientation
                 vecB1_hat = utils.vectorize(B1_main)
-                H1_main[:, :, nn, kk], H1_est = orientation_estimate(Y1_main_tilde[:, :, nn, kk], Y0_main_bar[:, :, nn, kk], vecB1_hat)
-                Y1_bar_hat = H1_main[:, :, nn, kk] @ Y1_main_tilde[:, :, nn, kk]
+                H1_main[kk, nn], H1_est = orientation_estimate(Y1_main_tilde[kk, nn], Y0_main_bar[kk, nn], vecB1_hat)
+                Y1_bar_hat = H1_main[kk, nn] @ Y1_main_tilde[kk, nn]
 
             if OPTIONS[1]:
                  # Coefficient estimates
-                 L = 4
-                 # Forming matrix V
-                 I_nel = np.identity(N_bar)
-                 V0 = np.kron(np.ones(t_pwd.shape), I_nel)
-                 V1 = np.kron(t_pwd, I_nel)
-                 V2 = np.kron(np.square(t_pwd), I_nel)
-                 V3 = np.kron(np.power(t_pwd, 3), I_nel)
-                 V4 = np.kron(np.power(t_pwd, 4), I_nel)
-                 # V = np.hstack((V0, V1, V2, V3))
-                 V = np.hstack((V0, V1, V2, V3, V4))
-                 #
                  # Forming matrix R
-                 tau = np.zeros((N_bar * (K + 1), 1))
-                 for ii in range(K + 1):
-                     tau[ii * n_EDM: (ii + 1) * n_EDM] = utils.half_vectorize(pwd_noise[:, :, ii], skew=True)
+                 tau = pwd_noise[:, iu_skew[0], iu_skew[1]].reshape((N_bar * (K + 1), 1))
 
                  # Solving for parameter theta
-                 alpha_hat_ls = pinv(V.T @ V) @ V.T @ tau
-                 # alpha_hat_ls = lstsq(V, tau)
-
-                 # getting the true range derivatives by dividing by appropriate coefficients as given by taylor expansion
-                 gamma = np.zeros(L + 1)
-                 for ii in range(L + 1):
-                     gamma[ii] = math.factorial(ii)
-
-                 # accounting for the factorials
-                 alpha_hat_ls_factored = np.kron(np.diag(gamma), I_nel) @ alpha_hat_ls
+                 alpha_hat_ls_factored = V_ls @ tau
 
                  r0_hat = alpha_hat_ls_factored[:N_bar]
                  R0_hat = utils.half_vectorize_inverse(r0_hat, skew=True)
@@ -247,61 +255,88 @@ if __name__ == "__main__":
 
                  # Creating B matrices
                  B0_gtwr = -0.5 * C @ np.multiply(R0_hat, R0_hat) @ C
-                 err_gtwr_b0[:, nn, kk] = np.squeeze(b0 - utils.half_vectorize(B0_gtwr))
+                 err_gtwr_b0[kk, nn] = np.squeeze(b0 - utils.half_vectorize(B0_gtwr))
 
                  B1_gtwr = -C @ np.multiply(R0_hat, R1_hat) @ C
-                 err_gtwr_b1[:, nn, kk] = np.squeeze(b1 - utils.half_vectorize(B1_gtwr))
+                 err_gtwr_b1[kk, nn] = np.squeeze(b1 - utils.half_vectorize(B1_gtwr))
 
                  B2_gtwr = -C @ (np.multiply(R0_hat, R2_hat) + np.multiply(R1_hat, R1_hat)) @ C
                  # B2_main = Y1.T @ Y1 = 0.5 * B2_gtwr
-                 err_gtwr_b2[:, nn, kk] = np.squeeze(b2 - 0.5 * utils.half_vectorize(B2_gtwr))
+                 err_gtwr_b2[kk, nn] = np.squeeze(b2 - 0.5 * utils.half_vectorize(B2_gtwr))
 
                  # relative position  - centered
-                 Y0_gtwr_bar[:, :, nn, kk] = utils.cMDS(B0_gtwr, center=False)[:nDim, :]
-                 err_gtwr_y0[:, nn, kk], H_Y0 = procrustes_error(Y0_gtwr_bar[:, :, nn, kk], Y0_bar)
+                 Y0_gtwr_bar[kk, nn] = utils.cMDS(B0_gtwr, center=False, nDim=nDim)
+                 err_gtwr_y0[kk, nn], H_Y0 = procrustes_error(Y0_gtwr_bar[kk, nn], Y0_bar)
 
                  # relative velocity - centered
-                 Y1_gtwr_tilde[:, :, nn, kk] = utils.cMDS(0.5 * B2_gtwr, center=False)[:nDim, :]
-                 err_gtwr_y1[:, nn, kk], H_Y1 = procrustes_error(Y1_gtwr_tilde[:, :, nn, kk], Y1_bar)
+                 Y1_gtwr_tilde[kk, nn] = utils.cMDS(0.5 * B2_gtwr, center=False, nDim=nDim)
+                 err_gtwr_y1[kk, nn], H_Y1 = procrustes_error(Y1_gtwr_tilde[kk, nn], Y1_bar)
 
                  # relative orientation
-                 H1_gtwr[:, :, nn, kk], H1_est = orientation_estimate(Y1_gtwr_tilde[:, :, nn, kk], Y0_gtwr_bar[:, :, nn, kk], vecB1_hat)
-                 Y1_bar_hat = H1_gtwr[:, :, nn, kk] @ Y1_gtwr_tilde[:, :, nn, kk]
-
-        rmse_main_b0[kk] = np.sqrt(np.sum(np.square(norm(err_main_b0[:, :, kk], axis=0))) / N_EXP) / n_bar
-        rmse_main_b1[kk] = np.sqrt(np.sum(np.square(norm(err_main_b1[:, :, kk], axis=0))) / N_EXP) / n_bar
-        rmse_main_b2[kk] = np.sqrt(np.sum(np.square(norm(err_main_b2[:, :, kk], axis=0))) / N_EXP) / n_bar
-        rmse_main_y0[kk] = np.sqrt(np.sum(np.square(norm(err_main_y0[:, :, kk], axis=0))) / N_EXP) / (nDim * N)
-        rmse_main_y1[kk] = np.sqrt(np.sum(np.square(norm(err_main_y1[:, :, kk], axis=0))) / N_EXP) / (nDim * N)
+                 H1_gtwr[kk, nn], H1_est = orientation_estimate(Y1_gtwr_tilde[kk, nn], Y0_gtwr_bar[kk, nn], vecB1_hat)
+                 Y1_bar_hat = H1_gtwr[kk, nn] @ Y1_gtwr_tilde[kk, nn]
+
+        if OPTIONS[0]:
+            rmse_main_b0[kk] = np.sqrt(np.sum(np.square(norm(err_main_b0[kk], axis=1))) / N_EXP) / n_bar
+            rmse_main_b1[kk] = np.sqrt(np.sum(np.square(norm(err_main_b1[kk], axis=1))) / N_EXP) / n_bar
+            rmse_main_b2[kk] = np.sqrt(np.sum(np.square(norm(err_main_b2[kk], axis=1))) / N_EXP) / n_bar
+            rmse_main_y0[kk] = np.sqrt(np.sum(np.square(norm(err_main_y0[kk], axis=1))) / N_EXP) / (nDim * N)
+            rmse_main_y1[kk] = np.sqrt(np.sum(np.square(norm(err_main_y1[kk], axis=1))) / N_EXP) / (nDim * N)
+
+        if OPTIONS[1]:
+            rmse_gtwr_b0[kk] = np.sqrt(np.sum(np.square(norm(err_gtwr_b0[kk], axis=1))) / N_EXP) / n_bar
+            rmse_gtwr_b1[kk] = np.sqrt(np.sum(np.square(norm(err_gtwr_b1[kk], axis=1))) / N_EXP) / n_bar
+            rmse_gtwr_b2[kk] = np.sqrt(np.sum(np.square(norm(err_gtwr_b2[kk], axis=1))) / N_EXP) / n_bar
+            rmse_gtwr_y0[kk] = np.sqrt(np.sum(np.square(norm(err_gtwr_y0[kk], axis=1))) / N_EXP) / (nDim * N)
+            rmse_gtwr_y1[kk] = np.sqrt(np.sum(np.square(norm(err_gtwr_y1[kk], axis=1))) / N_EXP) / (nDim * N)
+
+    # back to the (..., N_EXP, len(K_array)) layout of the saved results
+    if OPTIONS[0]:
+        Y0_main_bar = np.transpose(Y0_main_bar, (2, 3, 1, 0))
+        Y1_main_tilde = np.transpose(Y1_main_tilde, (2, 3, 1, 0))
+        H1_main = np.transpose(H1_main, (2, 3, 1, 0))
+        err_main_b0 = np.transpose(err_main_b0, (2, 1, 0))
+        err_main_b1 = np.transpose(err_main_b1, (2, 1, 0))
+        err_main_b2 = np.transpose(err_main_b2, (2, 1, 0))
+        err_main_y0 = np.transpose(err_main_y0, (2, 1, 0))
+        err_main_y1 = np.transpose(err_main_y1, (2, 1, 0))
 
-        rmse_gtwr_b0[kk] = np.sqrt(np.sum(np.square(norm(err_gtwr_b0[:, :, kk], axis=0))) / N_EXP) / n_bar
-        rmse_gtwr_b1[kk] = np.sqrt(np.sum(np.square(norm(err_gtwr_b1[:, :, kk], axis=0))) / N_EXP) / n_bar
-        rmse_gtwr_b2[kk] = np.sqrt(np.sum(np.square(norm(err_gtwr_b2[:, :, kk], axis=0))) / N_EXP) / n_bar
-        rmse_gtwr_y0[kk] = np.sqrt(np.sum(np.square(norm(err_gtwr_y0[:, :, kk], axis=0))) / N_EXP) / (nDim * N)
-        rmse_gtwr_y1[kk] = np.sqrt(np.sum(np.square(norm(err_gtwr_y1[:, :, kk], axis=0))) / N_EXP) / (nDim * N)
+    if OPTIONS[1]:
+        Y0_gtwr_bar = np.transpose(Y0_gtwr_bar, (2, 3, 1, 0))
+        Y1_gtwr_tilde = np.transpose(Y1_gtwr_tilde, (2, 3, 1, 0))
+        H1_gtwr = np.transpose(H1_gtwr, (2, 3, 1, 0))
+        err_gtwr_b0 = np.transpose(err_gtwr_b0, (2, 1, 0))
+        err_gtwr_b1 = np.transpose(err_gtwr_b1, (2, 1, 0))
+        err_gtwr_b2 = np.transpose(err_gtwr_b2, (2, 1, 0))
+        err_gtwr_y0 = np.transpose(err_gtwr_y0, (2, 1, 0))
+        err_gtwr_y1 = np.transpose(err_gtwr_y1, (2, 1, 0))
 
     fig, axs = plt.subplots(3, 1)
     axs[0].set_yscale('log')
     axs[1].set_yscale('log')
     axs[2].set_yscale('log')
-    axs[0].plot(K_array, rmse_main_b0, 'bo-')
-    axs[0].plot(K_array, rmse_gtwr_b0, 'rs--')
+    if OPTIONS[0]:
+        axs[0].plot(K_array, rmse_main_b0, 'bo-')
+        axs[1].plot(K_array, rmse_main_b1, 'bo-')
+        axs[2].plot(K_array, rmse_main_b2, 'bo-')
+    if OPTIONS[1]:
+        axs[0].plot(K_array, rmse_gtwr_b0, 'rs--')
+        axs[1].plot(K_array, rmse_gtwr_b1, 'rs--')
+        axs[2].plot(K_array, rmse_gtwr_b2, 'rs--')
     axs[0].grid()
-    axs[1].plot(K_array, rmse_main_b1, 'bo-')
-    axs[1].plot(K_array, rmse_gtwr_b1, 'rs--')
     axs[1].grid()
-    axs[2].plot(K_array, rmse_main_b2, 'bo-')
-    axs[2].plot(K_array, rmse_gtwr_b2, 'rs--')
     axs[2].grid()
 
     fig2, axs2 = plt.subplots(2, 1)
     axs2[0].set_yscale('log')
     axs2[1].set_yscale('log')
-    axs2[0].plot(K_array, rmse_main_y0, 'bo-')
-    axs2[0].plot(K_array, rmse_gtwr_y0, 'rs--')
+    if OPTIONS[0]:
+        axs2[0].plot(K_array, rmse_main_y0, 'bo-')
+        axs2[1].plot(K_array, rmse_main_y1, 'bo-')
+    if OPTIONS[1]:
+        axs2[0].plot(K_array, rmse_gtwr_y0, 'rs--')
+        axs2[1].plot(K_array, rmse_gtwr_y1, 'rs--')
     axs2[0].grid()
-    axs2[1].plot(K_array, rmse_main_y1, 'bo-')
-    axs2[1].plot(K_array, rmse_gtwr_y1, 'rs--')
     axs2[1].grid()
 
     plt.show()
@@ -315,7 +350,7 @@ if __name__ == "__main__":
                 np.savez(results_file, N=N, K=K_array, rmse_main_y0=rmse_main_y0, rmse_main_y1=rmse_main_y1,
                          rmse_main_b0=rmse_main_b0, rmse_main_b1=rmse_main_b1, rmse_main_b2=rmse_main_b2)
             elif not OPTIONS[0] and OPTIONS[1]:
-                np.savez(results_file, N=N, K=K_array, rmse_gtwr_y0=rmse_gtwr_y0, rmse_gtwr_y1=rmse_main_y1,
+                np.savez(results_file, N=N, K=K_array, rmse_gtwr_y0=rmse_gtwr_y0, rmse_gtwr_y1=rmse_gtwr_y1,
                          rmse_gtwr_b0=rmse_gtwr_b0, rmse_gtwr_b1=rmse_gtwr_b1, rmse_gtwr_b2=rmse_gtwr_b2)
             else:
                 np.savez(results_file, N=N, K=K_array, rmse_main_y0=rmse_main_y0, rmse_main_y1=rmse_main_y1,
@@ -83,7 +83,7 @@ if __name__ == "__main__":
                 else:
                     J1_main[ii, jj * nDim: (jj + 1) * nDim] = np.zeros(2)
 
-        Dm = utils.duplication_matrix_char(N)
+        Dm = utils.duplication_matrix(N)
         M = -0.5 * pinv(Dm) @ np.kron(C.T, C) @ Dm
 
         rmse_main_y0 = np.zeros(len(K_array))
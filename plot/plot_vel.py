@@ -2,7 +2,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 from numpy.linalg import norm
-import utils_rl
+import utils
 
 mpl.use('Qt5Agg')
 # font = {'size': 12}
@@ -80,11 +80,11 @@ for kk in range(len(rmse_K)):
             X_est[:, :, jj, ii] = Y0_main[:, :, jj, kk] + Y1_main * t_pwd[ii]
 
         # The two trajectories are not aligned. Thus, we do the alignment at t = 0!
-        err, H = utils_rl.procrustes_error(X_est[:, :, jj, idx], Y0_bar)
+        err, H = utils.procrustes_error(X_est[:, :, jj, idx], Y0_bar)
         # calculating the error per time step
         for ii in range(K + 1):
             X_est_align[:, :, jj, ii] = H.T @ X_est[:, :, jj, ii]
-            err_X[:, jj, ii] = np.squeeze(utils_rl.vectorize(X_bar[:, :, ii] - X_est_align[:, :, jj, ii]))
+            err_X[:, jj, ii] = np.squeeze(utils.vectorize(X_bar[:, :, ii] - X_est_align[:, :, jj, ii]))
 
     # calculating the rmse per time step combining all runs
     rmse_X[kk] = np.sqrt(np.sum(norm(err_X, axis=0) ** 2, axis=0) / N_EXP) / (nDim * N)
@@ -2,12 +2,46 @@ import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
 import itertools
+import functools
+import math
 import cvxpy as cp
 from scipy.sparse import csr_matrix
-import sympy as sym
-from scipy.optimize import minimize, NonlinearConstraint, lsq_linear
-from numpy.linalg import pinv, lstsq, norm, svd
-from scipy.linalg import orthogonal_procrustes
+from scipy.spatial.distance import pdist, squareform
+from scipy.optimize import minimize, lsq_linear
+from numpy.linalg import lstsq, norm
+from scipy.linalg import orthogonal_procrustes, eigh
+from scipy.linalg.lapack import get_lapack_funcs, _compute_lwork
+
+# LAPACK handles and workspace sizes per problem shape (see svd_cached and lstsq_cached)
+_gesdd_cache = {}
+_gelsd_cache = {}
+# numba kernel for pairwise_distance(backend='numba'), compiled on first use
+_pairwise_distance_nb = None
+
+def _read_only(a):
+    a = np.array(a, dtype=float)
+    a.setflags(write=False)
+    return a
+
+# fixed 2 x 2 row operations used by solve_lyapunov_like_eqns, built once
+_ROT_90 = _read_only([[0., -1.], [1., 0.]])
+_FLIP_X = _read_only([[-1., 0.], [0., 1.]])
+_SWAP_XY = _read_only([[0., 1.], [1., 0.]])
+
+# triangle index tuples are reused across calls with the same size (read-only, shared)
+@functools.lru_cache(maxsize=128)
+def _triu_idx(n, k=0):
+    idx = np.triu_indices(n, k)
+    for ii in idx:
+        ii.setflags(write=False)
+    return idx
+
+@functools.lru_cache(maxsize=128)
+def _tril_idx(n, k=0):
+    idx = np.tril_indices(n, k)
+    for ii in idx:
+        ii.setflags(write=False)
+    return idx
 
 def edm(X):
     d, n = X.shape
@@ -19,15 +53,56 @@ def edm(X):
 
     return D
 
-def pairwise_distance(X):
-    d, n = X.shape
-    pair_dist = np.zeros((n, n))
+def _numba_pairwise_distance():
+    # numba is optional and only imported when backend='numba' is requested
+    global _pairwise_distance_nb
+    if _pairwise_distance_nb is None:
+        try:
+            from numba import njit, prange
+        except ImportError:
+            raise ImportError("pairwise_distance(backend='numba') requires the optional numba package") from None
+
+        @njit(parallel=True, fastmath=True, cache=True)
+        def kernel(X, squared):
+            d, n = X.shape
+            out = np.empty((n, n))
+            for ii in prange(n):
+                for jj in range(n):
+                    s = 0.
+                    for kk in range(d):
+                        diff = X[kk, ii] - X[kk, jj]
+                        s += diff * diff
+                    out[ii, jj] = s if squared else math.sqrt(s)
+
+            return out
+
+        _pairwise_distance_nb = kernel
+
+    return _pairwise_distance_nb
+
+def pairwise_distance(X, squared=False, backend='blas'):
+    if backend not in ('blas', 'scipy', 'numba'):
+        raise ValueError("backend must be one of 'blas', 'scipy' or 'numba', got %r" % (backend,))
+
+    if backend == 'scipy':
+        # exact pairwise norms from scipy's C loop, no cancellation for points far from the origin
+        return squareform(pdist(np.transpose(X), 'sqeuclidean' if squared else 'euclidean'))
+
+    if backend == 'numba':
+        return _numba_pairwise_distance()(np.ascontiguousarray(X, dtype=float), squared)
 
-    for ii in range(n):
-        for jj in range(n):
-            pair_dist[ii, jj] = np.linalg.norm( X[:, ii] - X[:, jj] )
+    X = np.ascontiguousarray(X, dtype=float)
 
-    return pair_dist
+    G = X.T @ X
+    g = np.diag(G)
+    D = g[:, None] + g[None, :] - 2.0 * G
+    np.fill_diagonal(D, 0.)
+    np.clip(D, 0., None, out=D)
+
+    if squared:
+        return D
+
+    return np.sqrt(D)
 
 def double_center(D, opt=True):
     _, n = D.shape
@@ -44,53 +119,49 @@ def double_center(D, opt=True):
 
     return -0.5 * J.transpose().dot(D).dot(J)
 
-def cMDS(D, center=True):
+def cMDS(D, center=True, nDim=None):
     if center:
         G = double_center(D)
     else:
         G = D
 
+    if nDim is not None:
+        # only the top nDim eigenpairs, returned in descending order
+        n = G.shape[0]
+        eig_val, eig_vec = eigh(G, subset_by_index=[n - nDim, n - 1])
+        return (np.sqrt(np.maximum(eig_val, 0.))[:, None] * eig_vec.transpose())[::-1]
+
     eig_val, eig_vec = np.linalg.eigh(G)
-    indices = np.flipud(sorted(range(len(eig_val)), key=lambda k: eig_val[k]))
 
     # sorting eigenvalues and corresponding eigenvectors in descending order
+    indices = eig_val.argsort()[::-1]
     sorted_eig_val = eig_val[indices]
-    # fast sorting of numpy arrays (https://stackoverflow.com/questions/20265229/rearrange-columns-of-numpy-2d-array)
-    idx = np.empty_like(indices)
-    idx[indices] = np.arange(len(indices))
-    sorted_eig_vec = eig_vec[:, idx]
+    sorted_eig_vec = eig_vec[:, indices]
 
-    return np.diag(np.sqrt(sorted_eig_val)).dot(sorted_eig_vec.transpose())
+    # negative eigenvalues from noise are clipped to avoid NaNs in the sqrt
+    return np.sqrt(np.maximum(sorted_eig_val, 0.))[:, None] * sorted_eig_vec.transpose()
 
 def gt(X_list, n):
-    x = np.zeros((len(X_list), n))
-    y = np.zeros((len(X_list), n))
-    xrel = np.zeros((len(X_list), n))
-    yrel = np.zeros((len(X_list), n))
-
-    delta_s = np.zeros((len(X_list) , n))
-    rots = np.zeros((len(X_list)))
-    # x_delta_s = np.zeros((len(X_list), n))
-    inc_rots = np.zeros((len(X_list)))
+    # frames stacked along the first axis, shape (T, d, n)
+    X = np.stack(X_list, axis=0).astype(float)
 
-    for ii in range(len(X_list)):
-        # absolute coordinates
-        x[ii, :] = X_list[ii][0, :]
-        y[ii, :] = X_list[ii][1, :]
+    # absolute coordinates
+    x = X[:, 0, :]
+    y = X[:, 1, :]
 
-        # relative coordinates
-        xrel[ii, :] = x[ii, :] - x[ii, 0]
-        yrel[ii, :] = y[ii, :] - y[ii, 0]
+    # relative coordinates
+    xrel = x - x[:, :1]
+    yrel = y - y[:, :1]
 
-        # orientation of line joining node k and k'
-        rots[ii] = np.arctan2(yrel[ii, 1], xrel[ii, 1])
+    # orientation of line joining node k and k'
+    rots = np.arctan2(yrel[:, 1], xrel[:, 1])
+
+    # relative distance travelled
+    delta_s = np.zeros((len(X_list), n))
+    delta_s[1:, :] = np.sqrt(np.square(np.diff(xrel, axis=0)) + np.square(np.diff(yrel, axis=0)))
 
-        if ii:
-            # NOTE: np.sqrt and np.square give element-wise operations
-            # relative distance travelled
-            # x_delta_s[ii, :] = np.sqrt(np.square(x[ii, :] - x[ii - 1, :]) + np.square(y[ii, :] - y[ii - 1, :]))
-            delta_s[ii, :] = np.sqrt(np.square(xrel[ii, :] - xrel[ii - 1, :]) + np.square(yrel[ii, :] - yrel[ii - 1, :]))
     # incremental angle between different time frames for nodes k and k'
+    inc_rots = np.zeros((len(X_list)))
     inc_rots[1:] = np.diff(rots)
 
     return x, y, xrel, yrel, delta_s, inc_rots
@@ -125,10 +196,10 @@ def half_vectorize(X, skew=False, ch=False):
     # get the lower triangle indices to form a vector
     if skew:
         # idx = np.tril_indices(n1, -1)
-        idx = np.triu_indices(n1, 1)
+        idx = _triu_idx(n1, 1)
     else:
         # idx = np.tril_indices(n1)
-        idx = np.triu_indices(n1)
+        idx = _triu_idx(n1)
     n_el = len(idx[0])
 
     if ch:
@@ -136,34 +207,37 @@ def half_vectorize(X, skew=False, ch=False):
     else:
         vech = np.zeros((n_el, 1))
 
-    for ii in range(n_el):
-        vech[ii, 0] = X[idx[0][ii], idx[1][ii]]
+    vech[:, 0] = X[idx]
 
     return vech
 
 def half_vectorize_inverse(v, skew=False):
     n_el = len(v)
 
+    # n_el = n(n + 1)/2 (or n(n - 1)/2 if skew), solved exactly in integers
+    disc = 1 + 8 * n_el
+    r = math.isqrt(disc)
+    if r * r != disc:
+        raise ValueError('length of v is not a triangular number')
+
     if skew:
-        n = int((1 + np.sqrt(1 + 4 * (2 * n_el))) / 2)
+        n = (r + 1) // 2
     else:
-        n = int((-1 + np.sqrt(1 + 4 * (2 * n_el))) / 2)
+        n = (r - 1) // 2
 
     X = np.zeros((n, n))
 
     if skew:
         # idx = np.tril_indices(n, -1)
-        idx = np.triu_indices(n, 1)
-        for ii in range(n_el):
-            X[idx[0][ii], idx[1][ii]] = v[ii]
+        idx = _triu_idx(n, 1)
+        X[idx] = np.ravel(v)
         X += X.transpose()
     else:
         # idx = np.tril_indices(n)
-        idx = np.triu_indices(n)
-        for ii in range(n_el):
-            X[idx[0][ii], idx[1][ii]] = v[ii]
-            # using the fact that the opposite of the indexing gives the upper half
-            X[idx[1][ii], idx[0][ii]] = v[ii]
+        idx = _triu_idx(n)
+        X[idx] = np.ravel(v)
+        # using the fact that the opposite of the indexing gives the upper half
+        X[idx[1], idx[0]] = np.ravel(v)
 
     return X
 
@@ -171,14 +245,10 @@ def vectorize(A, ch=False):
     rows, cols = A.shape
     if ch:
         vecA = np.chararray((rows * cols, 1))
-    else:
-        vecA = np.zeros((rows * cols, 1))
+        vecA[:, 0] = A.ravel(order='F')
+        return vecA
 
-    for ii in range(cols):
-        # vecA[ii * cols: (ii + 1) * cols] = A[:, ii].reshape((rows, 1))
-        vecA[ii * rows: (ii + 1) * rows] = A[:, ii].reshape((rows, 1))
-
-    return vecA
+    return A.reshape((rows * cols, 1), order='F').astype(float)
 
 def vectorize_inverse(v, rows=None, cols=None):
     n = len(v)
@@ -187,11 +257,7 @@ def vectorize_inverse(v, rows=None, cols=None):
         cols = int(np.sqrt(n))
         rows = int(np.sqrt(n))
 
-    A = np.zeros((rows, cols))
-    for ii in range(cols):
-        A[:, ii] = v[ii * rows: (ii + 1) * rows].reshape(rows)
-
-    return A
+    return np.reshape(v[:rows * cols], (rows, cols), order='F').astype(float)
 
 # source: https://stackoverflow.com/questions/60678746/compute-commutation-matrix-in-numpy-scipy-efficiently
 def commutation_matrix(m, n):
@@ -203,12 +269,8 @@ def commutation_matrix(m, n):
 
 # source: https://en.wikipedia.org/wiki/Commutation_matrix
 def commutation_matrix_wiki(m, n):
-    K = np.zeros((n * m, m* n))
-    for ii in range(m):
-        for jj in range(n):
-            K[ii + m * jj, jj + n * ii] = 1
-
-    return K
+    # dense float copy of the sparse construction above
+    return commutation_matrix(m, n).toarray().astype(float)
 
 def sdp_edm(D, nDim, n):
     Dtilde = double_center(D)
@@ -219,18 +281,18 @@ def sdp_edm(D, nDim, n):
 
     # Schur complement
     I = np.identity(nDim)
-    In = np.identity(n)
+    one = np.ones((n, 1))
     M = cp.bmat([[Y, Z.T], [Z, I]])
 
     # for indexing in symmetric matrix
-    idx = np.tril_indices(n, -1)
-    n_el = len(idx[0])
+    idx = _tril_idx(n, -1)
+
+    # all strictly lower distances as one constraint: diag(Y) 1^T + 1 diag(Y)^T - 2Y
+    y = cp.reshape(cp.diag(Y), (n, 1))
+    E = y @ one.T + one @ y.T - 2 * Y
 
     constraints = [M >> 0]
-    constraints += [
-        (In[:, idx[0][ii]] - In[:, idx[1][ii]]) @ Y @ (In[:, idx[0][ii]] - In[:, idx[1][ii]]).T == D[
-            idx[0][ii], idx[1][ii]] for ii in range(n_el)
-    ]
+    constraints += [E[idx[0], idx[1]] == D[idx]]
 
     # adding the diagonal element constraints breaks the algorithm
     # constraints += [
@@ -254,14 +316,16 @@ def distance_derivatives_time(x1, v1, a1, x2, v2, a2):
     delx = x2 - x1
     delv = v2 - v1
     dela = a2 - a1
-    d = np.sqrt(delx.transpose().dot(delx))
+    dxx = delx @ delx
+    dxv = delx @ delv
+    d = np.sqrt(dxx)
 
     # first distance derivative
-    first_der = delx.transpose().dot(delv) / d
+    first_der = dxv / d
 
     # second distance derivative
-    first_term = -np.square(delx.transpose().dot(delv)) / d ** 3
-    second_term = (delv.transpose().dot(delv) + delx.transpose().dot(dela)) / d
+    first_term = -dxv * dxv / (dxx * d)
+    second_term = (delv @ delv + delx @ dela) / d
     second_der = first_term + second_term
 
     return np.array([d, first_der, second_der])
@@ -277,108 +341,52 @@ def range_taylor_coeffs(x1, v1, a1, x2, v2, a2, t=0.):
     dela = dely2
 
     # zeroth order derivative
-    d = np.sqrt(delx.transpose().dot(delx))
+    dxx = delx @ delx
+    dxv = delx @ delv
+    d = np.sqrt(dxx)
 
     # first distance derivative
-    first_der = delx.transpose().dot(delv) / d
+    first_der = dxv / d
 
     # second distance derivative
-    first_term = -np.square(delx.transpose().dot(delv)) / d ** 3
-    second_term = (delv.transpose().dot(delv) + delx.transpose().dot(dela)) / d
+    first_term = -dxv * dxv / (dxx * d)
+    second_term = (delv @ delv + delx @ dela) / d
     second_der = first_term + second_term
 
     return np.array([d, first_der, second_der])
 
-def duplication_matrix(N):
-    # source: https://en.wikipedia.org/wiki/Duplication_and_elimination_matrices
-    idx = np.tril_indices(N)
-    N_bar = int(N * (N + 1) / 2.)
-    # duplication matrix initialization
-    D = np.zeros((N ** 2, N_bar))
+def time_design_matrix(t, n, order):
+    # [kron(t^0, I_n), kron(t^1, I_n), ..., kron(t^order, I_n)] without calling np.kron
+    t = np.asarray(t).reshape(-1)
+    powers = np.vander(t, order + 1, increasing=True)
+    T = powers[:, None, :, None] * np.identity(n)[None, :, None, :]
 
-    for ii in range(N):#range(N ** 2):
-        for jj in range(N):#range(int(N * (N + 1) / 2.)):
-            if jj <= ii:
-                u_ij = np.zeros((N_bar, 1))
-                # tmp_idx = int((jj - 1) * N + ii - (jj * (jj - 1)) / 2.)
-                tmp_idx = int(jj * N + ii + 1. - ((jj + 1.) * jj) / 2.) - 1
-                # if tmp_idx < N_bar and tmp_idx > - N_bar:
-                #     u_ij[tmp_idx] = 1.
-                u_ij[tmp_idx] = 1.
-                T_ij = np.zeros((N, N))
-                T_ij[ii, jj] = 1.
-                T_ij[jj, ii] = 1.
-
-                tmp = u_ij.dot(vectorize(T_ij).reshape((N ** 2, 1)).transpose())
-                D += tmp.transpose()
+    return T.reshape((len(t) * n, (order + 1) * n))
 
-    return D
-
-def duplication_matrix_new(N):
-    # source: https://math.stackexchange.com/questions/3984389/on-the-relation-between-the-vectorization-and-the-half-vectorization
-    N_bar = int(N * (N + 1) / 2.)
-
-    # duplication matrix initialization
-    D = np.zeros((N ** 2, N_bar))
-
-    for ii in range(N):
-        for jj in range(N):
-            for gg in range(N):
-                for hh in range(N):
-                    if gg <= hh:
-                        rIdx = (ii + 1) * (jj + 1) - 1
-                        cIdx = (gg + 1) * (hh + 1) - 1
-                        if rIdx < N ** 2 and cIdx < N_bar:
-                            D[rIdx, cIdx] = 1. / 2. * (int(ii == gg) * int(jj == hh) + int(ii == hh) * int(jj == gg))
-    return D
-
-def duplication_matrix_char(N):
+def duplication_matrix(N):
+    # source: https://en.wikipedia.org/wiki/Duplication_and_elimination_matrices
+    # column k of D maps vech entry k, i.e. the (i, j) pair in triu order, to vec positions i + N * j and j + N * i
+    idx = _triu_idx(N)
     N_bar = int(N * (N + 1) / 2.)
-
-    letters = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm', 'n', 'o', 'p', 'q', 'r', 's', 't', 'u',
-               'v', 'w', 'x', 'y', 'z', 'A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O', 'P',
-               'Q', 'R', 'S', 'T', 'U', 'V', 'W', 'X', 'Y', 'Z', '+', '-', '=']
-    idx = np.triu_indices(N)
+    cols = np.arange(N_bar)
 
     # duplication matrix initialization
     D = np.zeros((N ** 2, N_bar))
-    D_char = np.chararray((N, N))
-
-    for ii in range(N_bar):
-        D_char[idx[0][ii], idx[1][ii]] = letters[ii]
-        D_char[idx[1][ii], idx[0][ii]] = letters[ii]
-
-    # vectorizing D_char
-    vecD_char = vectorize(D_char, ch=True)
-
-    # half vectorize D_char
-    vechD_char = half_vectorize(D_char, ch=True)
-
-    for jj in range(N ** 2):
-        idx = np.where(vechD_char == vecD_char[jj])
-        D[jj, idx[0]] = 1.
+    D[idx[0] + N * idx[1], cols] = 1.
+    D[idx[1] + N * idx[0], cols] = 1.
 
     return D
 
 def selection_matrix(N):
-    # number of unique elements in a symmetric matrix with zero diagonal
-    N_bar = int(N * (N - 1) / 2.)
-
     # number of unique elements in a symmetric matrix
     n_bar = int(N * (N + 1) / 2.)
 
     L = elim_mat(N)
 
-    # positions where the zero rows are to be added
-    S = np.zeros((N_bar, N ** 2))
+    # rows of L picking the diagonal elements are dropped
     zero_row_ids = np.concatenate((np.array([0]), np.cumsum(np.arange(N, 1, -1))))
-    counter = 0
-    for ii in range(N_bar):
-        if ii in zero_row_ids:
-            continue
-        else:
-            S[counter, :] = L[ii, :]
-            counter += 1
+    keep = np.setdiff1d(np.arange(n_bar), zero_row_ids)
+    S = L[keep, :]
 
     return S
 
@@ -389,18 +397,11 @@ def off_diag_select_matrix(N):
     # number of unique elements in a symmetric matrix
     n_bar = int(N * (N + 1) / 2.)
 
-    I = np.identity(N_bar)
-
     # positions where the zero rows are to be added
     S = np.zeros((n_bar, N_bar))
     zero_row_ids = np.cumsum(np.arange(N, 1, -1))
-    counter = 0
-    for ii in range(n_bar - 1):
-        if ii + 1 in zero_row_ids:
-            continue
-        else:
-            S[ii + 1, :] = I[counter, :]
-            counter += 1
+    keep = np.setdiff1d(np.arange(1, n_bar), zero_row_ids)
+    S[keep, np.arange(N_bar)] = 1.
 
     return S
 
@@ -516,6 +517,93 @@ def procrustes(X, Y, scaling=True, reflection='best'):
 
     return d, Z, tform
 
+def procrustes_batch(Xs, Ys, scaling=True, reflection='best'):
+    """
+    Batched version of `procrustes` over a stack of frames.
+
+    Inputs:
+    ------------
+    Xs, Ys
+        arrays of shape (T, n, m) holding T pairs of target and input
+        coordinates, aligned frame by frame with one batched SVD.
+
+    scaling, reflection
+        as in `procrustes`
+
+    Outputs
+    ------------
+    d, Z, tform
+        as in `procrustes`, stacked along the first axis (tform entries
+        have shapes (T, m, m), (T,) and (T, m))
+
+    """
+
+    Xs = np.asarray(Xs, dtype=float)
+    Ys = np.asarray(Ys, dtype=float)
+
+    muX = Xs.mean(1, keepdims=True)
+    muY = Ys.mean(1, keepdims=True)
+
+    X0 = Xs - muX
+    Y0 = Ys - muY
+
+    ssX = (X0 ** 2.).sum((1, 2))
+    ssY = (Y0 ** 2.).sum((1, 2))
+
+    # centred Frobenius norm
+    normX = np.sqrt(ssX)
+    normY = np.sqrt(ssY)
+
+    # scale to equal (unit) norm
+    X0 /= normX[:, None, None]
+    Y0 /= normY[:, None, None]
+
+    # optimum rotation matrices of Y, one SVD call for all frames
+    A = X0.transpose(0, 2, 1) @ Y0
+    U, s, Vt = np.linalg.svd(A, full_matrices=False)
+    V = Vt.transpose(0, 2, 1)
+    T = V @ U.transpose(0, 2, 1)
+
+    if reflection != 'best':
+
+        # does the current solution use a reflection?
+        have_reflection = np.linalg.det(T) < 0
+
+        # if that's not what was specified, force another reflection
+        flip = have_reflection != reflection
+        V[flip, :, -1] *= -1
+        s[flip, -1] *= -1
+        T = V @ U.transpose(0, 2, 1)
+
+    traceTA = s.sum(1)
+
+    if scaling:
+
+        # optimum scaling of Y
+        b = traceTA * normX / normY
+
+        # standarised distance between X and b*Y*T + c
+        d = 1 - traceTA ** 2
+
+        # transformed coords
+        Z = (normX * traceTA)[:, None, None] * (Y0 @ T) + muX
+
+    else:
+        b = np.ones(len(Xs))
+        d = 1 + ssY / ssX - 2 * traceTA * normY / normX
+        Z = normY[:, None, None] * (Y0 @ T) + muX
+
+    c = muX[:, 0, :] - b[:, None] * (muY @ T)[:, 0, :]
+
+    # transformation values
+    tform = {'rotation': T, 'scale': b, 'translation': c}
+
+    return d, Z, tform
+
+def _nonzero(h, eps=1e-12):
+    # keep the sign of a near-zero rotation entry but bound it away from zero before dividing
+    return h if abs(h) > eps else np.copysign(eps, h)
+
 def solve_lyapunov_like_eqns_sym(A, B, C, D, M=2, N=4):
     '''
     Solve Lyapunov-like equations of the form
@@ -525,9 +613,9 @@ def solve_lyapunov_like_eqns_sym(A, B, C, D, M=2, N=4):
     '''
 
     # SVD
-    UA, lmdA, VTA = np.linalg.svd(A, full_matrices=True)
+    UA, lmdA, VTA = svd_cached(A, full_matrices=True)
     VA = VTA.transpose()
-    UC, lmdC, VTC = np.linalg.svd(C, full_matrices=True)
+    UC, lmdC, VTC = svd_cached(C, full_matrices=True)
     VC = VTC.transpose()
 
     B_tilde = VTA.dot(B).dot(VA)
@@ -540,31 +628,31 @@ def solve_lyapunov_like_eqns_sym(A, B, C, D, M=2, N=4):
     D12_tilde = D_tilde[:M, M:]
     D22_tilde = D_tilde[M:, M:]
 
-    Y2_est = np.linalg.pinv(np.diag(lmdA)).dot(B12_tilde)
-    Y2_bar_est = np.linalg.pinv(np.diag(lmdC)).dot(D12_tilde)
+    # diag(lmd) is M x M diagonal: invert it elementwise rather than through pinv's SVD
+    Y2_est = B12_tilde / lmdA[:, None]
+    Y2_bar_est = D12_tilde / lmdC[:, None]
     y11_est = B11_tilde[0, 0] / (2. * lmdA[0])
     y22_est = B11_tilde[1, 1] / (2. * lmdA[1])
     y11_bar_est = D11_tilde[0, 0] / (2. * lmdC[0])
     y22_bar_est = D11_tilde[1, 1] / (2. * lmdC[1])
 
     K = np.kron(VTA, UA.transpose())
-    Kinv = np.linalg.pinv(K)
+    # kron of orthogonal factors is orthogonal, so its pseudo-inverse is the transpose
+    Kinv = K.transpose()
+    assert np.allclose(K.dot(Kinv), np.identity(K.shape[0]))
     K_bar = np.kron(VTC, UC.transpose())
     idx = (N - M) * M
     K2 = K[-idx:]
     K2_bar = K_bar[-idx:]
 
-    h1, h2, h3, h4, u, v = sym.symbols('h1 h2 h3 h4 u v')
-
-    h = np.array([[h1, h2], [h3, h4]])
-    y_new = np.vstack((np.array([[y11_est], [u], [v], [y22_est]]), vectorize(Y2_est)))
-    I = np.identity(N)
-    P_new = np.kron(I, h)
-    y_bar_new = K_bar.dot(P_new).dot(Kinv).dot(y_new)
+    # y_bar = K_bar (I kron h) Kinv y with h = [[h1, h2], [h3, h4]] and y = [y11, u, v, y22, vec(Y2)]
+    # is linear in h and affine in (u, v); T[a][b] is the linear map multiplying h_ab
+    T = [[K_bar[:, a::M].dot(Kinv[b::M, :]) for b in range(M)] for a in range(M)]
+    y_new = np.vstack((np.array([[y11_est], [0.], [0.], [y22_est]]), vectorize(Y2_est)))
 
-    unknowns = [h1, h2, h3, h4, h2 * u, h4 * u, h1 * v, h3 * v]
-    n_meas = (N - M) * M + M
-    Mat = np.zeros((n_meas, len(unknowns)))
+    # coefficients of the unknowns [h1, h2, h3, h4, h2 * u, h4 * u, h1 * v, h3 * v]
+    Mat = np.hstack((T[0][0].dot(y_new), T[0][1].dot(y_new), T[1][0].dot(y_new), T[1][1].dot(y_new),
+                     T[0][1][:, 1:2], T[1][1][:, 1:2], T[0][0][:, 2:3], T[1][0][:, 2:3]))
 
     '''
         I want to remove the off-diagonal terms of a square matrix Y in the vectorized y
@@ -574,14 +662,8 @@ def solve_lyapunov_like_eqns_sym(A, B, C, D, M=2, N=4):
                 - in other form, running from 0 to M ** 2 with a gap of M + 1 
     '''
     idx_diag = np.arange(0, M ** 2, M + 1)
-    counter = 0
-    for ii in range(M * N):
-        tmp = sym.Poly(y_bar_new[ii][0], h1, h2, h3, h4, u, v)
-        if ii in idx_diag or ii > M ** 2 - 1:  # to allow for only diagonal indices in Y1
-            # rearranging coefficients [h1, h2, h1*u, h1*v, h2*u, h2*v]
-            for jj in range(len(unknowns)):
-                Mat[counter, jj] = tmp.coeff_monomial(unknowns[jj])
-            counter += 1
+    # to allow for only diagonal indices in Y1
+    Mat = np.vstack((Mat[idx_diag], Mat[M ** 2:]))
 
     # masked_array = np.ma.masked_where(Mat < 1e-6, Mat)
     # cmap = matplotlib.cm.spring  # Can be any colormap that you want after the cm
@@ -601,10 +683,10 @@ def solve_lyapunov_like_eqns_sym(A, B, C, D, M=2, N=4):
     h2_val = unknowns[1][0]
     h3_val = unknowns[2][0]
     h4_val = unknowns[3][0]
-    u_1 = unknowns[4][0] / h2_val
-    u_2 = unknowns[5][0] / h4_val
-    v_1 = unknowns[6][0] / h1_val
-    v_2 = unknowns[7][0] / h3_val
+    u_1 = unknowns[4][0] / _nonzero(h2_val)
+    u_2 = unknowns[5][0] / _nonzero(h4_val)
+    v_1 = unknowns[6][0] / _nonzero(h1_val)
+    v_2 = unknowns[7][0] / _nonzero(h3_val)
 
     print("\n Rotation matrix")
     print(np.array([[h1_val, h2_val], [h3_val, h4_val]]))
@@ -623,8 +705,9 @@ def solve_lyapunov_like_eqns_sym(A, B, C, D, M=2, N=4):
     '''
     Y_est = np.hstack((np.array([[y11_est, v_1], [u_1, y22_est]]), Y2_est))
     Y_est2 = np.hstack((np.array([[y11_est, v_2], [u_2, y22_est]]), Y2_est))
-    X_est = np.linalg.pinv(UA).dot(Y_est).dot(np.linalg.pinv(VA))
-    X_est2 = np.linalg.pinv(UA).dot(Y_est2).dot(np.linalg.pinv(VA))
+    # UA and VA are orthogonal, so their pseudo-inverses are the transposes
+    X_est = UA.transpose().dot(Y_est).dot(VTA)
+    X_est2 = UA.transpose().dot(Y_est2).dot(VTA)
     H_est = np.array([[h1_val, h2_val], [h3_val, h4_val]])
     # H_est_sp = np.array([[h1_val_sp, -h2_val_sp], [h2_val_sp, h1_val_sp]])
     # H_est_min = np.array([[h1_val_min, -h2_val_min], [h2_val_min, h1_val_min]])
@@ -640,76 +723,56 @@ def solve_lyapunov_like_eqns(A, B, C, D, M=2, N=4, method='least_squares'):
     '''
 
     # SVD
-    UA, lmdA, VTA = np.linalg.svd(A, full_matrices=True)
+    UA, lmdA, VTA = svd_cached(A, full_matrices=True)
     VA = VTA.transpose()
-    UC, lmdC, VTC = np.linalg.svd(C, full_matrices=True)
+    UC, lmdC, VTC = svd_cached(C, full_matrices=True)
     VC = VTC.transpose()
 
-    B_tilde = VTA.dot(B).dot(VA)
-    D_tilde = VTC.dot(D).dot(VC)
+    # only the first M rows of the rotated B and D are used (blocks 11 and 12)
+    B_tilde = VTA[:M].dot(B).dot(VA)
+    D_tilde = VTC[:M].dot(D).dot(VC)
 
-    B11_tilde = B_tilde[:M, :M]
-    B12_tilde = B_tilde[:M, M:]
-    B22_tilde = B_tilde[M:, M:]
-    D11_tilde = D_tilde[:M, :M]
-    D12_tilde = D_tilde[:M, M:]
-    D22_tilde = D_tilde[M:, M:]
+    B11_tilde = B_tilde[:, :M]
+    B12_tilde = B_tilde[:, M:]
+    D11_tilde = D_tilde[:, :M]
+    D12_tilde = D_tilde[:, M:]
 
-    Y2_est = np.linalg.pinv(np.diag(lmdA)).dot(B12_tilde)
-    Y2_bar_est = np.linalg.pinv(np.diag(lmdC)).dot(D12_tilde)
+    # diag(lmd) is M x M diagonal: invert it elementwise rather than through pinv's SVD
+    Y2_est = B12_tilde / lmdA[:, None]
+    Y2_bar_est = D12_tilde / lmdC[:, None]
     y11_est = B11_tilde[0, 0] / (2. * lmdA[0])
     y22_est = B11_tilde[1, 1] / (2. * lmdA[1])
     y11_bar_est = D11_tilde[0, 0] / (2. * lmdC[0])
     y22_bar_est = D11_tilde[1, 1] / (2. * lmdC[1])
 
-    K = np.kron(VTA, UA.transpose())
-    Kinv = np.linalg.pinv(K)
-    K_bar = np.kron(VTC, UC.transpose())
-    # idx = (N - M) * M
-
-    Mat = np.zeros((M * N, 6))
-    Matr = np.zeros((M * N, 6))
-    Kinv_check = np.zeros(Kinv.shape)
-    swap_idx = swap_rows(M, N)
-    for ll in range(M * N):
-        Kinv_check[ll, :] = Kinv[swap_idx[ll], :]
-
-    T_h1 = np.zeros((M * N, M * N))
-    T_h2 = np.zeros((M * N, M * N))
-    Tr_h1 = np.zeros((M * N, M * N))
-    Tr_h2 = np.zeros((M * N, M * N))
-    y_tmp = np.vstack((np.array([[y11_est], [np.nan], [np.nan], [y22_est]]), vectorize(Y2_est)))
-    # yr_tmp = np.vstack((np.array([[y11_est], [np.nan], [np.nan], [-y22_est]]), vectorize(np.array([[1, 0], [0, -1]]).dot(Y2_est))))
-    for ii in range(M * N):
-        for jj in range(M * N):
-            for kk in range(M * N):
-                # no reflection
-                T_h1[ii, jj] += K_bar[ii, kk] * Kinv[kk, jj]
-                T_h2[ii, jj] += np.power(-1, kk + 1) * K_bar[ii, kk] * Kinv_check[kk, jj]
-                # with reflection
-                Tr_h1[ii, jj] += np.power(-1, kk + 1) * K_bar[ii, kk] * Kinv[kk, jj]
-                Tr_h2[ii, jj] += K_bar[ii, kk] * Kinv_check[kk, jj]
-            if jj != 1 and jj != 2:
-                # no reflection
-                Mat[ii, 0] += T_h1[ii, jj] * y_tmp[jj] # h1
-                Mat[ii, 1] += T_h2[ii, jj] * y_tmp[jj] # h2
-                # with reflection
-                Matr[ii, 0] += Tr_h1[ii, jj] * y_tmp[jj]  # h1
-                Matr[ii, 1] += Tr_h2[ii, jj] * y_tmp[jj]  # h2
-            if jj == 1:
-                # no reflection
-                Mat[ii, 2] += T_h1[ii, jj] # h1 * u
-                Mat[ii, 4] += T_h2[ii, jj] # h2 * u
-                # with reflection
-                Matr[ii, 2] += Tr_h1[ii, jj]  # h1 * u
-                Matr[ii, 4] += Tr_h2[ii, jj]  # h2 * u
-            if jj == 2:
-                # no reflection
-                Mat[ii, 3] += T_h1[ii, jj] # h1 * v
-                Mat[ii, 5] += T_h2[ii, jj] # h2 * v
-                # with reflection
-                Matr[ii, 3] += Tr_h1[ii, jj]  # h1 * v
-                Matr[ii, 5] += Tr_h2[ii, jj]  # h2 * v
+    '''
+        K = kron(VTA, UA^T) and K_bar = kron(VTC, UC^T) are never formed:
+            - K vec(X) = vec(UA^T X VTA^T), and K is orthogonal so Kinv vec(Y) = vec(UA Y VTA)
+            - the sign flips and row swaps between K_bar and Kinv act on the M = 2 rows of Y
+              as a 2 x 2 matrix G, so K_bar G Kinv vec(Y) = vec(UC^T G UA Y VTA VTC^T)
+    '''
+    R = VTA.dot(VTC.transpose())
+    # no reflection: G = I (h1) and G = [[0, -1], [1, 0]] (h2)
+    W_h1 = UC.transpose().dot(UA)
+    W_h2 = UC.transpose().dot(_ROT_90).dot(UA)
+    # with reflection: G = [[-1, 0], [0, 1]] (h1) and G = [[0, 1], [1, 0]] (h2)
+    Wr_h1 = UC.transpose().dot(_FLIP_X).dot(UA)
+    Wr_h2 = UC.transpose().dot(_SWAP_XY).dot(UA)
+
+    # known part of Y (u = Y[1, 0] and v = Y[0, 1] zeroed)
+    Y_known = np.hstack((np.array([[y11_est, 0.], [0., y22_est]]), Y2_est))
+    Y_known_R = Y_known.dot(R)
+
+    def lyap_columns(W1, W2):
+        # columns: h1, h2, h1 * u, h1 * v, h2 * u, h2 * v
+        cols = (W1.dot(Y_known_R), W2.dot(Y_known_R), np.outer(W1[:, 1], R[0]), np.outer(W1[:, 0], R[1]),
+                np.outer(W2[:, 1], R[0]), np.outer(W2[:, 0], R[1]))
+        return np.column_stack([c.ravel(order='F') for c in cols])
+
+    # no reflection
+    Mat = lyap_columns(W_h1, W_h2)
+    # with reflection
+    Matr = lyap_columns(Wr_h1, Wr_h2)
 
     # removing the rows corresponding to unknown y_bar
     Mat = np.delete(Mat, [1, 2], axis=0)
@@ -718,20 +781,32 @@ def solve_lyapunov_like_eqns(A, B, C, D, M=2, N=4, method='least_squares'):
     # collecting known values of y_bar
     r = np.vstack((np.array([[y11_bar_est], [y22_bar_est]]), vectorize(Y2_bar_est)))
 
+    # set when the fit with reflection (Matr) wins, H_est then takes the reflection form
+    reflected = False
     if method == 'least_squares':
-        x = cp.Variable((Mat.shape[1], 1))
-        objective = cp.Minimize(cp.sum_squares(Mat @ x - r))
-        constraints = [cp.norm(x) <= 10]
-        prob = cp.Problem(objective, constraints)
-
-        res_cp = prob.solve()
-        sol = np.copy(x.value)
+        # solve with and without reflection and keep the better fit, as in 'scipy_minimize'
+        sol = None
+        for is_refl, Mat_ls in ((False, Mat), (True, Matr)):
+            # the norm bound is rarely active: solve the unconstrained problem in closed form first
+            sol_ls = lstsq(Mat_ls, r, rcond=None)[0]
+            if norm(sol_ls) > 10:
+                x = cp.Variable((Mat_ls.shape[1], 1))
+                objective = cp.Minimize(cp.sum_squares(Mat_ls @ x - r))
+                constraints = [cp.norm(x) <= 10]
+                prob = cp.Problem(objective, constraints)
+
+                res_cp = prob.solve()
+                sol_ls = np.copy(x.value)
+
+            res_ls = norm(Mat_ls.dot(sol_ls) - r)
+            if sol is None or res_ls < res_min:
+                sol, res_min, reflected = sol_ls, res_ls, is_refl
         h1_val = sol[0, 0]
         h2_val = sol[1, 0]
-        u_1 = sol[2, 0] / h1_val
-        v_1 = sol[3, 0] / h1_val
-        u_2 = sol[4, 0] / h2_val
-        v_2 = sol[5, 0] / h2_val
+        u_1 = sol[2, 0] / _nonzero(h1_val)
+        v_1 = sol[3, 0] / _nonzero(h1_val)
+        u_2 = sol[4, 0] / _nonzero(h2_val)
+        v_2 = sol[5, 0] / _nonzero(h2_val)
 
         print("\n Lyap-like least square errors closed form solution")
         print(np.array([[h1_val, h2_val], [u_1, u_2], [v_1, v_2]]))
@@ -743,10 +818,10 @@ def solve_lyapunov_like_eqns(A, B, C, D, M=2, N=4, method='least_squares'):
         res = lsq_linear(Mat, r.reshape(n_meas), bounds=(lb, ub))
         h1_val = res.x[0]
         h2_val = res.x[1]
-        u_1 = res.x[2] / h1_val
-        v_1 = res.x[3] / h1_val
-        u_2 = res.x[4] / h2_val
-        v_2 = res.x[5] / h2_val
+        u_1 = res.x[2] / _nonzero(h1_val)
+        v_1 = res.x[3] / _nonzero(h1_val)
+        u_2 = res.x[4] / _nonzero(h2_val)
+        v_2 = res.x[5] / _nonzero(h2_val)
 
         print("\n Lyap-like least square errors from scipy lsq_linear")
         print(np.array([[h1_val, h2_val], [u_1, u_2], [v_1, v_2]]))
@@ -754,29 +829,31 @@ def solve_lyapunov_like_eqns(A, B, C, D, M=2, N=4, method='least_squares'):
     elif method == 'scipy_minimize':
         '''
             scipy.optimize.minimize
+            the constraints h2 (h1 u) = h1 (h2 u) and h2 (h1 v) = h1 (h2 v) only say that both columns share
+            the same (u, v): with x = bilinear_params(z), z = [h1, h2, u, v], the problem is unconstrained
         '''
-        tol1 = 1e-3
-        tol2 = 1e-3
-        con1 = lambda x: x[1] * x[2] - x[0] * x[4]
-        con2 = lambda x: x[1] * x[3] - x[0] * x[5]
-        con3 = lambda x: x[0] ** 2 + x[1] ** 2 - 1
-        nlc1 = NonlinearConstraint(con1, -tol1, tol1)
-        nlc2 = NonlinearConstraint(con2, -tol1, tol1)
-        # nlc3 = NonlinearConstraint(con3, -tol2, tol2)
-        cons = (nlc1, nlc2)
-        res = minimize(func, np.zeros(6), args=(Mat, r), constraints=cons)
-        resr = minimize(func, np.zeros(6), args=(Matr, r), constraints=cons)
-        if res.fun < resr.fun:
-            sol = res
-        else:
-            sol = resr
+        sol = None
+        for is_refl, Mat_min in ((False, Mat), (True, Matr)):
+            # start from the unconstrained least squares solution, (u, v) fitted to h u and h v
+            x_ls = lstsq(Mat_min, r, rcond=None)[0].ravel()
+            h_sq = x_ls[0] ** 2 + x_ls[1] ** 2
+            if h_sq > 1e-12:
+                z0 = np.array([x_ls[0], x_ls[1], (x_ls[0] * x_ls[2] + x_ls[1] * x_ls[4]) / h_sq,
+                               (x_ls[0] * x_ls[3] + x_ls[1] * x_ls[5]) / h_sq])
+            else:
+                # no usable rotation estimate to fit (u, v) against, start them at zero
+                z0 = np.array([x_ls[0], x_ls[1], 0., 0.])
+            res = minimize(func_bilinear, z0, args=(Mat_min, r), jac=func_bilinear_jac)
+            if sol is None or res.fun < sol.fun:
+                sol, reflected = res, is_refl
+        sol.x = bilinear_params(sol.x)
 
         h1_val = sol.x[0]
         h2_val = sol.x[1]
-        u_1 = sol.x[2] / h1_val
-        v_1 = sol.x[3] / h1_val
-        u_2 = sol.x[4] / h2_val
-        v_2 = sol.x[5] / h2_val
+        u_1 = sol.x[2] / _nonzero(h1_val)
+        v_1 = sol.x[3] / _nonzero(h1_val)
+        u_2 = sol.x[4] / _nonzero(h2_val)
+        v_2 = sol.x[5] / _nonzero(h2_val)
 
         print("\n Lyap-like least square errors from scipy minimize")
         print(np.array([[h1_val, h2_val], [u_1, u_2], [v_1, v_2]]))
@@ -787,10 +864,10 @@ def solve_lyapunov_like_eqns(A, B, C, D, M=2, N=4, method='least_squares'):
 
         h1_val = x_tls[0, 0]
         h2_val = x_tls[1, 0]
-        u_1 = x_tls[2, 0] / h1_val
-        v_1 = x_tls[3, 0] / h1_val
-        u_2 = x_tls[4, 0] / h2_val
-        v_2 = x_tls[5, 0] / h2_val
+        u_1 = x_tls[2, 0] / _nonzero(h1_val)
+        v_1 = x_tls[3, 0] / _nonzero(h1_val)
+        u_2 = x_tls[4, 0] / _nonzero(h2_val)
+        v_2 = x_tls[5, 0] / _nonzero(h2_val)
 
         print("\n Lyap-like least square errors closed form solution")
         print(np.array([[h1_val, h2_val], [u_1, u_2], [v_1, v_2]]))
@@ -799,40 +876,51 @@ def solve_lyapunov_like_eqns(A, B, C, D, M=2, N=4, method='least_squares'):
 
     Y_est = np.hstack((np.array([[y11_est, v_1], [u_1, y22_est]]), Y2_est))
     Y_est2 = np.hstack((np.array([[y11_est, v_2], [u_2, y22_est]]), Y2_est))
-    X_est = np.linalg.pinv(UA).dot(Y_est).dot(np.linalg.pinv(VA))
-    X_est2 = np.linalg.pinv(UA).dot(Y_est2).dot(np.linalg.pinv(VA))
-    H_est = np.array([[h1_val, -h2_val], [h2_val, h1_val]])
+    # UA and VA are orthogonal, so their pseudo-inverses are the transposes
+    X_est = UA.transpose().dot(Y_est).dot(VTA)
+    X_est2 = UA.transpose().dot(Y_est2).dot(VTA)
+    if reflected:
+        # h1 [[-1, 0], [0, 1]] + h2 [[0, 1], [1, 0]]
+        H_est = np.array([[-h1_val, h2_val], [h2_val, h1_val]])
+    else:
+        H_est = np.array([[h1_val, -h2_val], [h2_val, h1_val]])
 
     return X_est, H_est
 
-def swap_rows(M, N):
-    swap_idx = np.zeros(M * N, dtype=int)
-    for ii in range(N):
-        swap_idx[M * ii] = M * ii + 1
-        swap_idx[M * ii + 1] = M * ii
+def bilinear_params(z):
+    # x = [h1, h2, h1 * u, h1 * v, h2 * u, h2 * v] from z = [h1, h2, u, v]
+    return np.array([z[0], z[1], z[0] * z[2], z[0] * z[3], z[1] * z[2], z[1] * z[3]])
 
-    return swap_idx
+def func_bilinear(z, A, b):
+    return func(bilinear_params(z), A, b)
 
-def func(x, A, b):
-    z = np.array([x[0], x[1], x[2], x[3], x[4], x[5]]).reshape((6, 1))
+def func_bilinear_jac(z, A, b):
+    # chain rule through d bilinear_params / dz
+    J = np.array([[1., 0., 0., 0.],
+                  [0., 1., 0., 0.],
+                  [z[2], 0., z[0], 0.],
+                  [z[3], 0., 0., z[0]],
+                  [0., z[2], z[1], 0.],
+                  [0., z[3], 0., z[1]]])
 
-    tmp = (A.dot(z) - b).reshape((b.shape[0], 1))
-    tmp2 = tmp.transpose().dot(tmp)
-    cost = tmp2[0][0] #+ x[6] * (x[1] * x[2] - x[0] * x[4]) + x[7] * (x[1] * x[3] - x[0] * x[5])
+    return J.T.dot(func_jac(bilinear_params(z), A, b))
+
+def func(x, A, b):
+    res = A.dot(x) - np.ravel(b)
+    cost = float(res.dot(res))
 
     return cost
 
+def func_jac(x, A, b):
+    return 2. * A.T.dot(A.dot(x) - np.ravel(b))
+
 def elim_mat(m):
-    T = np.tril(np.ones(m)) # Lower triangle of 1's
-    f = np.nonzero(vectorize(T).squeeze()) # Get linear indexes of 1's
+    T = np.tril(np.ones((m, m))) # Lower triangle of 1's
+    f = np.flatnonzero(T.ravel(order='F')) # Get linear indexes of 1's in vec(T)
     k = int(m* (m + 1.) / 2.) # Row size of L
     m2 = m * m # Colunm size of L
-    # L = np.zeros((m2, k)) # Start with L'
-    L = np.zeros(m2 * k)  # Start with L'
-    x = f[0] + m2 * np.arange(0, k) # Linear indexes of the 1's within L'
-    L[x] = 1 # Put the 1's in place
-    L = vectorize_inverse(L, rows=m2, cols=k)
-    L = L.T # Now transpose to actual L
+    L = np.zeros((k, m2))
+    L[np.arange(k), f] = 1 # Put the 1's in place
 
     return L
 
@@ -840,46 +928,85 @@ def polygon(X):
     D, N = X.shape
     c = np.mean(X, 1) # mean / central point
     d = X - c[:, None] # vectors connecting the central point and the given points
-    th = np.zeros(N)
     th = np.arctan2(d[1, :], d[0, :])  # angle above x axis
     # for jj in range(X.shape[1]):
     #     th[jj] = np.arctan2(d[1, jj], d[0, jj]) # angle above x axis
     #     print(th)
     idx = np.argsort(th) # sorting the angles
-    Y = X[:, idx] # sorting the given points
-    Y = np.hstack((Y, Y[:, 0].reshape(D, 1))) # add the first at the end to close the polygon
+    Y = np.empty((D, N + 1), dtype=X.dtype)
+    Y[:, :N] = X[:, idx] # sorting the given points
+    Y[:, N] = X[:, idx[0]] # add the first at the end to close the polygon
 
     return Y
 
 # source: https://github.com/RyotaBannai/total-least-squares/blob/master/tsl.py
 def tls(X, y):
-    if len(X.shape) is 1:
+    if X.ndim == 1:
         n = 1
         X = X.reshape(len(X), 1)
     else:
         n = np.array(X).shape[1]  # the number of variable of X
 
+    # Z is a temporary, LAPACK may overwrite it
     Z = np.vstack((X.T, y.T)).T
-    U, s, Vt = svd(Z, full_matrices=True)
+    U, s, Vt = svd_cached(Z, full_matrices=(Z.shape[0] < Z.shape[1]), overwrite_a=True)
 
     V = Vt.T
     Vxy = V[:n, n:]
     Vyy = V[n:, n:]
-    a_tls = - Vxy / Vyy  # total least squares soln
-
-    np.linalg.solve()
+    a_tls = - Vxy.dot(np.linalg.inv(Vyy))  # total least squares soln
 
-    Xtyt = - Z.dot(V[:, n:]).dot(V[:, n:].T)
-    Xt = Xtyt[:, :n]  # X error
+    # Z V_n V_n^T is the [X y] error; V_n has orthonormal columns so the (N, n + 1) product is not needed
+    # Z V = U diag(s), with zero columns past len(s)
+    ZV = np.zeros((Z.shape[0], V.shape[1] - n))
+    ZV[:, :max(len(s) - n, 0)] = U[:, n:len(s)] * s[n:]
+    Xt = - ZV.dot(Vxy.T)  # X error
     y_tls = (X + Xt).dot(a_tls)
 
-    fro_norm = norm(Xtyt, 'fro')  # Frobenius norm
+    fro_norm = norm(ZV, 'fro')  # Frobenius norm
 
     return y_tls, X + Xt, a_tls, fro_norm
 
+def svd_cached(A, full_matrices=False, overwrite_a=False):
+    # svd through LAPACK gesdd (no finiteness check); the workspace query is done once per shape
+    A = np.asarray(A, dtype=np.float64)
+    key = (A.shape, full_matrices)
+    if key not in _gesdd_cache:
+        gesdd, gesdd_lwork = get_lapack_funcs(('gesdd', 'gesdd_lwork'), (A,))
+        lwork = _compute_lwork(gesdd_lwork, A.shape[0], A.shape[1], compute_uv=1, full_matrices=int(full_matrices))
+        _gesdd_cache[key] = (gesdd, lwork)
+    gesdd, lwork = _gesdd_cache[key]
+
+    U, s, VT, info = gesdd(A, compute_uv=1, lwork=lwork, full_matrices=int(full_matrices), overwrite_a=int(overwrite_a))
+    if info > 0:
+        raise np.linalg.LinAlgError('SVD did not converge')
+
+    return U, s, VT
+
+def lstsq_cached(A, b):
+    # least squares (m >= n) through LAPACK gelsd; the workspace query is done once per shape
+    A = np.asarray(A, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    m, n = A.shape
+    nrhs = 1 if b.ndim == 1 else b.shape[1]
+    # same singular value cutoff as np.linalg.lstsq(..., rcond=None)
+    cond = np.finfo(np.float64).eps * max(m, n)
+    if (m, n, nrhs) not in _gelsd_cache:
+        gelsd, gelsd_lwork = get_lapack_funcs(('gelsd', 'gelsd_lwork'), (A, b))
+        lwork, iwork = _compute_lwork(gelsd_lwork, m, n, nrhs, cond)
+        _gelsd_cache[(m, n, nrhs)] = (gelsd, lwork, iwork)
+    gelsd, lwork, iwork = _gelsd_cache[(m, n, nrhs)]
+
+    x, s, rank, info = gelsd(A, b, lwork, iwork, cond, False, False)
+    if info > 0:
+        raise np.linalg.LinAlgError('SVD did not converge in Linear Least Squares')
+
+    return x[:n]
+
 def procrustes_error(Z, Z_bar):
     H, scale = orthogonal_procrustes(Z.T, Z_bar.T)
-    Z_proc = Z.T @ H
-    err_z = vectorize(Z_bar - Z_proc.T)
+    # aligned estimate in the (D, N) layout of Z_bar, no transposed copy
+    Z_proc = H.T @ Z
+    err_z = vectorize(Z_bar - Z_proc)
 
     return np.squeeze(err_z), H
\ No newline at end of file